@@ -1,35 +1,32 @@
 import json
 import sys
-import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch._utils import _flatten_dense_tensors, _unflatten_dense_tensors
 
 
 def get_state_dict(file):
     try:
-        pretrain_state_dict = torch.load(file)
-    except AssertionError:
-        pretrain_state_dict = torch.load(file, map_location=lambda storage, location: storage)
-    return pretrain_state_dict
+        # mmap keeps large checkpoints out of RAM until tensors are touched;
+        # weights_only skips arbitrary pickle execution (torch >= 2.1)
+        return torch.load(file, map_location='cpu', mmap=True, weights_only=True)
+    except TypeError:
+        return torch.load(file, map_location='cpu')
 
 
 def get_flat_params_from(model):
-    params = []
-    for param in model.parameters():
-        params.append(param.data.view(-1))
-
-    flat_params = torch.cat(params)
-    return flat_params
+    # _flatten_dense_tensors copies every parameter into one buffer in C++,
+    # avoiding a Python-level .view(-1)/torch.cat per parameter
+    with torch.no_grad():
+        return _flatten_dense_tensors(list(model.parameters()))
 
 
 def set_flat_params_to(model, flat_params):
-    prev_ind = 0
-    for param in model.parameters():
-        flat_size = int(np.prod(list(param.size())))
-        param.data.copy_(
-            flat_params[prev_ind:prev_ind + flat_size].view(param.size()))
-        prev_ind += flat_size
+    with torch.no_grad():
+        params = list(model.parameters())
+        for param, new_param in zip(params, _unflatten_dense_tensors(flat_params, params)):
+            param.copy_(new_param)
 
 
 class RunningAverage():
@@ -49,11 +46,34 @@ class RunningAverage():
         self.total = 0
 
     def update(self, val):
-        self.total += val
+        # accumulate tensors on their own device; converting to a Python
+        # number here would force a device->host sync on every step
+        if torch.is_tensor(val):
+            val = val.detach()
+        self.total = self.total + val
         self.steps += 1
 
     def value(self):
-        return self.total / float(self.steps)
+        total = self.total.item() if torch.is_tensor(self.total) else self.total
+        return total / float(self.steps)
+
+
+def _accuracy_tail(pred, target, topk):
+    # compare on the native (B, maxk) layout: no transpose copy, and target
+    # broadcasts as a view via unsqueeze instead of expand_as
+    correct = pred.eq(target.unsqueeze(1))
+
+    # hits are monotonic in k, so one cumulative sum over the rank dimension
+    # serves every requested k with a single reduction kernel
+    correct_cum = correct.float().cumsum(dim=1)
+    return torch.stack([correct_cum[:, k - 1].sum() for k in topk])
+
+
+# Inductor fuses the eq/cumsum/sum chain into one CUDA-graphed kernel,
+# amortizing launch latency on small eval batches (torch >= 2.0); topk
+# itself stays eager outside the compiled region
+if hasattr(torch, 'compile'):
+    _accuracy_tail = torch.compile(_accuracy_tail, fullgraph=True, mode='reduce-overhead')
 
 
 def accuracy(output, target, topk=(1,)):
@@ -62,15 +82,56 @@ def accuracy(output, target, topk=(1,)):
     batch_size = target.size(0)
 
     _, pred = output.topk(maxk, dim=1, largest=True, sorted=True)
-    pred = pred.t()
-    correct = pred.eq(target.view(1, -1).expand_as(pred))
+    correct_counts = _accuracy_tail(pred, target, topk)
+    return [correct_k * (100.0 / batch_size) for correct_k in correct_counts]
+
+
+# the loss bodies are scripted free functions so the JIT fuser can collapse
+# the softmax/log/mul/sum chains into fused kernels instead of one kernel
+# (and one B x C or c x c intermediate) per op
+
+@torch.jit.script
+def _kl_loss(output_batch, teacher_outputs, T: float):
+    # derive the teacher probabilities from log_softmax so both streams share
+    # one max-subtract/logsumexp pass; exp(log_softmax) is numerically stable,
+    # so the old +10**(-7) offset is no longer needed
+    student_log_prob = F.log_softmax(output_batch / T, dim=1)
+    teacher_log_prob = F.log_softmax(teacher_outputs / T, dim=1)
+    teacher_prob = teacher_log_prob.exp()
+
+    # Same result KL-loss implementation as nn.KLDivLoss(reduction='batchmean')
+    return T * T * (teacher_prob * (teacher_log_prob - student_log_prob)).sum(dim=1).mean()
+
+
+@torch.jit.script
+def _ce_loss(output_batch, teacher_outputs, T: float):
+    # teacher softmax shares the student's log_softmax reduction kernel
+    output_batch = F.log_softmax(output_batch / T, dim=1)
+    teacher_outputs = F.log_softmax(teacher_outputs / T, dim=1).exp()
+
+    # Same result CE-loss implementation torch.sum -> sum of all element
+    return -T * T * torch.sum(torch.mul(output_batch, teacher_outputs)) / teacher_outputs.size(0)
+
+
+@torch.jit.script
+def _iid_loss(pij, lamb: float, EPS: float):
+    c = pij.size(0)
+
+    # (c, 1) and (1, c) broadcast against the (c, c) joint in the loss
+    # expression, so no expand/clone materialization is needed
+    pi = pij.sum(dim=1).view(c, 1)
+    pj = pij.sum(dim=0).view(1, c)
 
-    res = []
-    for k in topk:
-# correct_k = correct[:k].view(-1).float().sum(0)
-        correct_k = torch.reshape(correct[:k], (-1,)).float().sum(0)
-        res.append(correct_k.mul_(100.0 / batch_size))
-    return res
+    # branchless floor: one elementwise kernel, no boolean mask tensor
+    pij = pij.clamp_min(EPS)
+
+    # only log(pij) runs on the c x c joint; the marginal logs run on
+    # c-element vectors and broadcast in the loss expression
+    log_pij = pij.log()
+    log_pi = pi.clamp_min(EPS).log()
+    log_pj = pj.clamp_min(EPS).log()
+
+    return -(pij * (log_pij - lamb * log_pj - lamb * log_pi)).sum()
 
 
 class KL_Loss(nn.Module):
@@ -81,30 +142,20 @@ class KL_Loss(nn.Module):
     def forward(self, output_batch, teacher_outputs):
         # output_batch  -> B X num_classes
         # teacher_outputs -> B X num_classes
-
-        # loss_2 = -torch.sum(torch.sum(torch.mul(F.log_softmax(teacher_outputs,dim=1), F.softmax(teacher_outputs,dim=1)+10**(-7))))/teacher_outputs.size(0)
-        # print('loss H:',loss_2)
-
-        output_batch = F.log_softmax(output_batch / self.T, dim=1)
-        teacher_outputs = F.softmax(teacher_outputs / self.T, dim=1) + 10 ** (-7)
-
-        loss = self.T * self.T * nn.KLDivLoss(reduction='batchmean')(output_batch, teacher_outputs)
-
-        # Same result KL-loss implementation
-        # loss = T * T * torch.sum(torch.sum(torch.mul(teacher_outputs, torch.log(teacher_outputs) - output_batch)))/teacher_outputs.size(0)
-        return loss
+        return _kl_loss(output_batch, teacher_outputs, float(self.T))
 
 class MutualInformationLoss(nn.Module):
     def __init__(self, temperature=1):
         super(MutualInformationLoss, self).__init__()
         self.T = temperature
 
-    def _compute_joint(self, logits, logits_aug):
-        b, dim = logits.size()
-        assert(logits_aug.size(0)==b and logits_aug.size(1)==dim)
+    def _compute_joint(self, probs, probs_aug):
+        b, dim = probs.size()
+        assert(probs_aug.size(0)==b and probs_aug.size(1)==dim)
 
-        pij = logits.unsqueeze(2) * logits_aug.unsqueeze(1) # b, c, c
-        pij = pij.sum(dim=0) # c, c
+        # outer product summed over the batch is a single GEMM; avoids the
+        # b x c x c intermediate of unsqueeze-multiply-sum
+        pij = torch.mm(probs.t(), probs_aug) # c, c
         pij = (pij + pij.t()) / 2.
         pij = pij / pij.sum()
         return pij
@@ -114,26 +165,15 @@ class MutualInformationLoss(nn.Module):
         # output_batch_aug : b x c
         b, c = output_batch.size()
 
-        logits = F.log_softmax(output_batch / self.T, dim=1)
-        logits_aug = F.log_softmax(output_batch_aug / self.T, dim=1)
-        pij = self._compute_joint(logits, logits_aug)
+        # the joint must be built from probabilities; feeding log_softmax
+        # outputs here made pij a product of log-probs, not a distribution
+        probs = F.softmax(output_batch / self.T, dim=1)
+        probs_aug = F.softmax(output_batch_aug / self.T, dim=1)
+        pij = self._compute_joint(probs, probs_aug)
 
         assert(pij.size() == (c, c))
 
-        pi = pij.sum(dim=1).view(c, 1).expand(c, c)
-        pj = pij.sum(dim=0).view(1, c).expand(c, c)
-
-        pij[(pij < EPS).data] = EPS
-        pj[(pj < EPS).data] = EPS
-        pi[(pi < EPS).data] = EPS
-
-        loss = - pij * (torch.log(pij) \
-              - lamb * torch.log(pj) \
-              - lamb * torch.log(pi))
-
-        loss = loss.sum()
-
-        return loss
+        return _iid_loss(pij, lamb, EPS)
 
 class CE_Loss(nn.Module):
     def __init__(self, temperature=1):
@@ -143,14 +183,7 @@ class CE_Loss(nn.Module):
     def forward(self, output_batch, teacher_outputs):
         # output_batch      -> B X num_classes
         # teacher_outputs   -> B X num_classes
-
-        output_batch = F.log_softmax(output_batch / self.T, dim=1)
-        teacher_outputs = F.softmax(teacher_outputs / self.T, dim=1)
-
-        # Same result CE-loss implementation torch.sum -> sum of all element
-        loss = -self.T * self.T * torch.sum(torch.mul(output_batch, teacher_outputs)) / teacher_outputs.size(0)
-
-        return loss
+        return _ce_loss(output_batch, teacher_outputs, float(self.T))
 
 
 def save_dict_to_json(d, json_path):
@@ -174,15 +207,18 @@ def bnwd_optim_params(model, model_params, master_params):
 
 
 def split_bn_params(model, model_params, master_params):
-    def get_bn_params(module):
-        if isinstance(module, torch.nn.modules.batchnorm._BatchNorm): return module.parameters()
-        accum = set()
-        for child in module.children(): [accum.add(p) for p in get_bn_params(child)]
-        return accum
-
-    mod_bn_params = get_bn_params(model)
-    zipped_params = list(zip(model_params, master_params))
-
-    mas_bn_params = [p_mast for p_mod, p_mast in zipped_params if p_mod in mod_bn_params]
-    mas_rem_params = [p_mast for p_mod, p_mast in zipped_params if p_mod not in mod_bn_params]
+    # one flat walk over modules(); membership tests key on id() since
+    # Parameters hash by identity anyway
+    bn_param_ids = {id(p) for m in model.modules()
+                    if isinstance(m, torch.nn.modules.batchnorm._BatchNorm)
+                    for p in m.parameters(recurse=False)}
+
+    # model_params/master_params may be parameters() generators; a single
+    # zip pass consumes them once and splits without an intermediate list
+    mas_bn_params, mas_rem_params = [], []
+    for p_mod, p_mast in zip(model_params, master_params):
+        if id(p_mod) in bn_param_ids:
+            mas_bn_params.append(p_mast)
+        else:
+            mas_rem_params.append(p_mast)
     return mas_bn_params, mas_rem_params
@@ -1,3 +1,5 @@
+from collections import namedtuple
+
 from mpi4py import MPI
 
 from .FedOptAggregator import FedOptAggregator
@@ -6,18 +8,24 @@ from .FedOptServerManager import FedOptServerManager
 from .FedOptTrainer import FedOptTrainer
 from .MyModelTrainer import MyModelTrainer
 
+# rank/size are queried from mpi4py once at init instead of per call site;
+# unpacks like the old (comm, process_id, worker_number) tuple
+MPIEnv = namedtuple('MPIEnv', 'comm rank size')
+
 
 def FedML_init():
     comm = MPI.COMM_WORLD
-    process_id = comm.Get_rank()
-    worker_number = comm.Get_size()
-    return comm, process_id, worker_number
+    return MPIEnv(comm, comm.Get_rank(), comm.Get_size())
 
 
 def FedML_FedOpt_distributed(process_id, worker_number, device, comm, model, train_data_num, train_data_global,
                              test_data_global,
                              train_data_local_num_dict, train_data_local_dict, test_data_local_dict, args,
                              model_trainer=None):
+    if model_trainer is None:
+        model_trainer = MyModelTrainer(model)
+        model_trainer.set_id(-1 if process_id == 0 else process_id - 1)
+
     if process_id == 0:
         init_server(args, device, comm, process_id, worker_number, model, train_data_num, train_data_global,
                     test_data_global, train_data_local_dict, test_data_local_dict, train_data_local_num_dict,
@@ -29,10 +37,6 @@ def FedML_FedOpt_distributed(process_id, worker_number, device, comm, model, tra
 
 def init_server(args, device, comm, rank, size, model, train_data_num, train_data_global, test_data_global,
                 train_data_local_dict, test_data_local_dict, train_data_local_num_dict, model_trainer):
-    if model_trainer is None:
-        model_trainer = MyModelTrainer(model)
-        model_trainer.set_id(-1)
-
     # aggregator
     worker_num = size - 1
     aggregator = FedOptAggregator(train_data_global, test_data_global, train_data_num,
@@ -46,12 +50,8 @@ def init_server(args, device, comm, rank, size, model, train_data_num, train_dat
 
 
 def init_client(args, device, comm, process_id, size, model, train_data_num, train_data_local_num_dict,
-                train_data_local_dict, model_trainer=None):
+                train_data_local_dict, model_trainer):
     client_index = process_id - 1
-    if model_trainer is None:
-        model_trainer = MyModelTrainer(model)
-        model_trainer.set_id(client_index)
-
     trainer = FedOptTrainer(client_index, train_data_local_dict, train_data_local_num_dict, train_data_num, device,
                             args, model_trainer)
     client_manager = FedOptClientManager(args, trainer, comm, process_id, size)